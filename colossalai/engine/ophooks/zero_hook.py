@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Optional
 
 import torch
 import torch.distributed as dist
@@ -15,12 +15,17 @@ from colossalai.utils.memory_utils.utils import colo_model_data_tensor_move_inli
 class ZeroHook(BaseOpHook):
     """
     A hook to process sharded param for ZeRO method.
+
+    If ``allgather_stream`` is given, the forward execution order of modules is recorded in the first iteration.
+    In the following iterations, when a module starts its backward pass, the params of the module which ran
+    right before it in forward are gathered on ``allgather_stream``, so the all-gather overlaps with backward compute.
     """
 
     def __init__(self,
                  shard_strategy: BaseShardStrategy,
                  memstarts_collector: Optional[MemStatsCollector],
-                 process_group: Optional[dist.ProcessGroup] = None):
+                 process_group: Optional[dist.ProcessGroup] = None,
+                 allgather_stream: Optional[torch.cuda.Stream] = None):
         super().__init__()
         self.shard_strategy = shard_strategy
         self.process_group = process_group
@@ -29,7 +34,52 @@ class ZeroHook(BaseOpHook):
 
         self._memstarts_collector = memstarts_collector
 
+        self._allgather_stream = allgather_stream
+        self._fwd_module_order: List[torch.nn.Module] = []
+        self._fwd_module_idx: Dict[torch.nn.Module, int] = {}
+        self._fwd_order_recorded = False
+
+    @property
+    def fwd_module_order(self) -> List[torch.nn.Module]:
+        """Modules in the order of their first forward execution, complete after the first iteration.
+        """
+        return self._fwd_module_order
+
+    def _record_fwd_order(self, module: torch.nn.Module):
+        # A module may run more than once in an iteration (shared modules, activation checkpointing)
+        # We only keep its first occurrence
+        if self._fwd_order_recorded or module in self._fwd_module_idx:
+            return
+        self._fwd_module_idx[module] = len(self._fwd_module_order)
+        self._fwd_module_order.append(module)
+
+    def _prefetch_prev_module(self, module: torch.nn.Module):
+        """Gather params of the module executed before ``module`` in forward on the all-gather stream.
+        """
+        if self._allgather_stream is None or not self._fwd_order_recorded:
+            return
+        idx = self._fwd_module_idx.get(module, 0)
+        if idx == 0:
+            return
+        prev_module = self._fwd_module_order[idx - 1]
+        tensor_list = [param.col_attr.sharded_data_tensor for param in prev_module.parameters(recurse=False)]
+        # Gathered payloads are consumed and released on the compute stream.
+        # Waiting for it here makes sure their memory is not reused by the all-gather stream too early.
+        self._allgather_stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(self._allgather_stream):
+            self.shard_strategy.gather(tensor_list, self.process_group)
+            for t in tensor_list:
+                colo_model_data_tensor_move_inline(t, self.computing_device)
+
+    def _wait_prefetch(self):
+        if self._allgather_stream is not None:
+            # Params may have been prefetched on the all-gather stream, and their payloads already point to
+            # the gathered tensors, e.g. a module recomputed by activation checkpointing in backward
+            torch.cuda.current_stream().wait_stream(self._allgather_stream)
+
     def pre_fwd_exec(self, module: torch.nn.Module, *args):
+        self._record_fwd_order(module)
+        self._wait_prefetch()
         tensor_list = []
         for param in module.parameters(recurse=False):
             assert hasattr(param, 'col_attr')
@@ -43,6 +93,7 @@ class ZeroHook(BaseOpHook):
             self._memstarts_collector.sample_memstats()
 
     def post_fwd_exec(self, module: torch.nn.Module, *args):
+        self._wait_prefetch()
         tensor_list = []
         for param in module.parameters(recurse=False):
             assert hasattr(param, 'col_attr')
@@ -52,6 +103,7 @@ class ZeroHook(BaseOpHook):
             param.col_attr.remove_torch_payload()
 
     def pre_bwd_exec(self, module: torch.nn.Module, input, output):
+        self._wait_prefetch()
         tensor_list = []
         for param in module.parameters(recurse=False):
             assert hasattr(param, 'col_attr')
@@ -72,6 +124,7 @@ class ZeroHook(BaseOpHook):
                     # The grad here must be locally computed full grad in this backward pass
                     assert param.grad.shape == param.col_attr.sharded_data_tensor.origin_shape
             param.col_attr.bwd_count += 1
+        self._prefetch_prev_module(module)
         if self._memstarts_collector:
             self._memstarts_collector.sample_memstats()
 
@@ -88,4 +141,9 @@ class ZeroHook(BaseOpHook):
         pass
 
     def post_iter(self):
-        pass
+        self._fwd_order_recorded = True
+
+    def detach_memstats_collector(self):
+        """Stop sampling memory statistics, once the collected ones are no longer needed.
+        """
+        self._memstarts_collector = None
@@ -1,7 +1,10 @@
-from typing import Any, Callable, List, Tuple
+import math
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional, Tuple, Union
 
 import torch
-import torch.nn.functional as F
+import torch.distributed as dist
+from torch.distributed import ProcessGroup
 
 
 def get_gradient_predivide_factor(world_size: int) -> float:
@@ -11,6 +14,23 @@ def get_gradient_predivide_factor(world_size: int) -> float:
     return float(factor)
 
 
+def parse_nccl_version(version: Union[int, Tuple[int, ...]]) -> Tuple[int, int]:
+    """Get (major, minor) of the NCCL version returned by ``torch.cuda.nccl.version()``,
+    which is an int in old PyTorch, e.g. 2708 for 2.7.8 and 21003 for 2.10.3, and a tuple in newer ones.
+    """
+    if isinstance(version, int):
+        major, rest = divmod(version, 10000 if version >= 10000 else 1000)
+        return major, rest // 100
+    return tuple(version[:2])
+
+
+def nccl_supports_avg(group: Optional[ProcessGroup] = None) -> bool:
+    """Whether ``ReduceOp.AVG`` can be used for collectives of the group, which needs NCCL >= 2.10."""
+    if not hasattr(dist.ReduceOp, 'AVG') or dist.get_backend(group) != 'nccl':
+        return False
+    return parse_nccl_version(torch.cuda.nccl.version()) >= (2, 10)
+
+
 def free_storage(data: torch.Tensor) -> None:
     """Free underlying storage of a Tensor."""
     if data.storage().size() > 0:
@@ -41,6 +61,56 @@ def cast_tensor_to_fp32(tensor: torch.Tensor) -> torch.Tensor:
     return tensor
 
 
+def multi_tensor_copy_(dst_list: List[torch.Tensor], src_list: List[torch.Tensor]) -> None:
+    """Copy (and cast) each tensor of ``src_list`` into the corresponding tensor of ``dst_list``.
+    Use a single multi-tensor kernel when ``torch._foreach_copy_`` is available.
+    """
+    if len(dst_list) == 0:
+        return
+    if hasattr(torch, '_foreach_copy_'):
+        torch._foreach_copy_(dst_list, src_list)
+    else:
+        for dst, src in zip(dst_list, src_list):
+            dst.copy_(src)
+
+
+def cast_tensor_list_to_fp32(tensor_list: List[torch.Tensor]) -> List[torch.Tensor]:
+    """Batched version of :func:`cast_tensor_to_fp32`. All fp16 tensors are cast in one multi-tensor copy."""
+    fp32_list = []
+    src_list, dst_list = [], []
+    for tensor in tensor_list:
+        if torch.is_floating_point(tensor) and tensor.dtype is torch.float16:
+            fp32_tensor = torch.empty_like(tensor, dtype=torch.float32)
+            src_list.append(tensor)
+            dst_list.append(fp32_tensor)
+            fp32_list.append(fp32_tensor)
+        else:
+            fp32_list.append(tensor)
+    multi_tensor_copy_(dst_list, src_list)
+    return fp32_list
+
+
+def cast_tensor_list_to_fp16(tensor_list: List[torch.Tensor]) -> List[torch.Tensor]:
+    """Batched version of :func:`cast_tensor_to_fp16`. All fp32 tensors which don't require grad are cast
+    in one multi-tensor copy, the others are cast by ``half()`` so that the cast is recorded by autograd.
+    """
+    fp16_list = []
+    src_list, dst_list = [], []
+    for tensor in tensor_list:
+        if torch.is_floating_point(tensor) and tensor.dtype is torch.float32:
+            if tensor.requires_grad:
+                fp16_list.append(tensor.half())
+                continue
+            fp16_tensor = torch.empty_like(tensor, dtype=torch.float16)
+            src_list.append(tensor)
+            dst_list.append(fp16_tensor)
+            fp16_list.append(fp16_tensor)
+        else:
+            fp16_list.append(tensor)
+    multi_tensor_copy_(dst_list, src_list)
+    return fp16_list
+
+
 def apply_to_tensors(x: Any, fn: Callable):
     if torch.is_tensor(x):
         return fn(x)
@@ -58,13 +128,60 @@ def cast_float_arguments(fn: Callable, *args: Any, **kwargs: Any) -> Tuple[Any,
     return apply_to_tensors(args, fn), apply_to_tensors(kwargs, fn)
 
 
-def chunk_and_pad(tensor: torch.Tensor, num_chunks: int) -> List[torch.Tensor]:
-    """Chunk a given Tensor into num_chunks parts and add any necessary padding."""
-    chunks = list(torch.flatten(tensor).chunk(num_chunks))
-    # torch.chunk may return fewer than num_chunks chunks, pad accordingly.
-    num_pad_for_partial_chunk = chunks[0].numel() - chunks[-1].numel()
-    if num_pad_for_partial_chunk > 0:
-        chunks[-1] = F.pad(chunks[-1], [0, num_pad_for_partial_chunk])
-    if len(chunks) < num_chunks:
-        chunks.extend([torch.zeros_like(chunks[0]) for _ in range(num_chunks - len(chunks))])
-    return chunks
+def cast_float_arguments_to_fp16(*args: Any, **kwargs: Any) -> Tuple[Any, Any]:
+    """Batched version of ``cast_float_arguments(cast_tensor_to_fp16, *args, **kwargs)``.
+    Tensors are collected from the arguments first, so that they are cast by :func:`cast_tensor_list_to_fp16`.
+    """
+    tensor_list = []
+    apply_to_tensors((args, kwargs), tensor_list.append)
+    if len(tensor_list) == 0:
+        return args, kwargs
+    fp16_iter = iter(cast_tensor_list_to_fp16(tensor_list))
+    # Tensors are visited in the same order as they were collected
+    return apply_to_tensors((args, kwargs), lambda _: next(fp16_iter))
+
+
+def chunk_and_pad(tensor: torch.Tensor, num_chunks: int, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """Flatten a given Tensor and pad it with zeros, so that it can be evenly chunked into num_chunks parts.
+    The result is a single contiguous tensor, whose i-th chunk matches the i-th chunk of ``torch.chunk``.
+    If ``out`` is given, the result is a view of its leading elements instead of a new tensor.
+    """
+    numel = tensor.numel()
+    padded_numel = math.ceil(numel / num_chunks) * num_chunks
+    if out is None:
+        padded = tensor.new_empty(padded_numel)
+    else:
+        assert out.dim() == 1 and out.numel() >= padded_numel
+        padded = out.narrow(0, 0, padded_numel)
+    padded.narrow(0, 0, numel).view_as(tensor).copy_(tensor)
+    # Only the tail is zeroed
+    padded.narrow(0, numel, padded_numel - numel).zero_()
+    return padded
+
+
+class FreeEventQueue:
+    """A bounded queue of buffers consumed by in-flight CUDA work, each paired with an event recorded after the work.
+    A buffer is safe to reuse once its event is done, so at most ``max_num_inflight`` buffers are alive.
+
+    Args:
+        max_num_inflight (int): max number of in-flight buffers.
+    """
+
+    def __init__(self, max_num_inflight: int) -> None:
+        self._queue: Deque[Tuple[torch.cuda.Event, Any]] = deque()
+        self._max_num_inflight = max_num_inflight
+
+    def enqueue(self, event: torch.cuda.Event, obj: Any) -> None:
+        self._queue.append((event, obj))
+
+    def dequeue_if_needed(self) -> Optional[Tuple[torch.cuda.Event, Any]]:
+        """Pop the oldest (event, buffer) pair if the queue is full, otherwise return None."""
+        if len(self._queue) >= self._max_num_inflight:
+            return self._queue.popleft()
+        return None
+
+    def clear(self) -> None:
+        self._queue.clear()
+
+    def __len__(self) -> int:
+        return len(self._queue)
@@ -19,36 +19,98 @@ else:
     enable_nccl_base_collectives = True
 
 
+def _reduce_scatter_flat(
+    output: Tensor, input_: Tensor, group: ProcessGroup, op: dist.ReduceOp = dist.ReduceOp.SUM
+) -> None:
+    """Reduce-scatter a contiguous input whose ``i``-th equal chunk is reduced into ``output`` of rank ``i``.
+    Prefer the single-tensor collectives, which don't need the input split into a list of chunks.
+    """
+    if enable_nccl_base_collectives:
+        if hasattr(dist, "reduce_scatter_tensor"):
+            dist.reduce_scatter_tensor(output, input_, op=op, group=group)
+            return
+        if hasattr(dist, "_reduce_scatter_base"):
+            dist._reduce_scatter_base(output, input_, op=op, group=group)
+            return
+    # fallback
+    dist.reduce_scatter(output, list(input_.view(group.size(), -1).unbind(0)), op=op, group=group)
+
+
 class Bucket:
-    def __init__(self, shard_size: int, dtype: torch.dtype, device: torch.device, group: ProcessGroup):
-        self.buffer = torch.zeros((group.size(), shard_size), dtype=dtype, device=device)
+    def __init__(
+        self,
+        shard_size: int,
+        dtype: torch.dtype,
+        device: torch.device,
+        group: ProcessGroup,
+        streams: Optional[List[torch.cuda.Stream]] = None,
+        op: dist.ReduceOp = dist.ReduceOp.SUM,
+        persistent: bool = False,
+    ):
+        # Each stream owns an input buffer, and flushes are issued on the streams round-robin,
+        # so the bucket can be refilled while the previous reduce-scatters are in flight.
+        # Without streams, flushes are issued on the current stream with a single buffer.
+        self.streams: List[Optional[torch.cuda.Stream]] = streams or [None]
+        # The input buffers of all streams are carved from a single allocation, as they live as long as the bucket
+        self.arena = torch.zeros((len(self.streams), group.size(), shard_size), dtype=dtype, device=device)
+        self.buffers = list(self.arena.unbind(0))
+        # persistent buckets keep their input buffers across ``free()`` instead of returning them to the allocator
+        self.persistent = persistent
+        # recorded on a stream after it flushes its buffer, the buffer can't be refilled before it
+        self.free_events: List[Optional[torch.cuda.Event]] = [None for _ in self.streams]
+        self.buffer_idx = 0
+        self.buffer = self.buffers[self.buffer_idx]
         self.group = group
+        self.op = op
         self.offset = 0
         self.callbacks: List[Callable] = []
-        self.output_shard = torch.zeros_like(self.buffer[0])
+        # (offset, numel) of each reduce-scatter input coalesced into the bucket, aligned with ``callbacks``
+        self.slices: List[Tuple[int, int]] = []
+        self.output_shard = torch.empty_like(self.buffer[0])
 
     def flush(self) -> None:
         """Flush content of the bucket."""
         if self.offset == 0:
             assert len(self.callbacks) == 0
             return
+        stream = self.streams[self.buffer_idx]
+        if stream is None:
+            self._flush_buffer()
+            self._new_output_shard()
+            return
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            self._flush_buffer()
+            free_event = torch.cuda.Event()
+            free_event.record(stream)
+        self.free_events[self.buffer_idx] = free_event
+        # The next flush may run on another stream, which only waits for the current stream.
+        # So its output shard is allocated here, rather than on the stream of this flush.
+        self._new_output_shard()
+        # switch to the next buffer, which is refilled on the current stream once its last flush is done
+        self.buffer_idx = (self.buffer_idx + 1) % len(self.buffers)
+        self.buffer = self.buffers[self.buffer_idx]
+        if self.free_events[self.buffer_idx] is not None:
+            torch.cuda.current_stream().wait_event(self.free_events[self.buffer_idx])
+
+    def _flush_buffer(self) -> None:
         # reduce-scatter bucket
-        if hasattr(dist, "_reduce_scatter_base") and enable_nccl_base_collectives:
-            dist._reduce_scatter_base(
-                self.output_shard[: self.offset], self.buffer[:, : self.offset].contiguous(), group=self.group
-            )
-        else:
-            dist.reduce_scatter(
-                self.output_shard[: self.offset], list(self.buffer[:, : self.offset].unbind(0)), group=self.group
-            )
-        # execute post-reduction callbacks
-        for callback_fn in self.callbacks:
-            callback_fn()
-        # reuse input bucket but allocate a fresh output shard
+        _reduce_scatter_flat(
+            self.output_shard[: self.offset], self.buffer[:, : self.offset].contiguous(), self.group, self.op
+        )
+        # execute post-reduction callbacks, each one receives a view of the reduced output shard
+        for callback_fn, (offset, numel) in zip(self.callbacks, self.slices):
+            callback_fn(self.output_shard.narrow(0, offset, numel))
+        # reuse input bucket, a fresh output shard is allocated by the caller
         self.buffer[:, : self.offset].zero_()
         self.offset = 0
         self.callbacks.clear()
-        self.output_shard = torch.zeros_like(self.buffer[0])
+        self.slices.clear()
+
+    def _new_output_shard(self) -> None:
+        # callbacks hold views of the previous output shard, which is fully overwritten up to ``offset`` by the next
+        # reduce-scatter, so it doesn't need to be zeroed
+        self.output_shard = torch.empty_like(self.buffer[0])
 
     def alloc(self) -> None:
         """Setup the buffers if they are not allocated.
@@ -58,28 +120,32 @@ class Bucket:
         memory to other parts of the training process, such as the forward pass
         for activation memory.
         """
-        for tensor in [self.buffer, self.output_shard]:
+        for tensor in [self.arena, self.output_shard]:
             if tensor.storage().size() == 0:
                 tensor.storage().resize_(tensor.size().numel())
 
     def free(self) -> None:
-        """Tear down the bucket by freeing the memory"""
-        assert self.offset == 0 and self.callbacks == [], "Incorrect call of teardown"
-        for tensor in [self.buffer, self.output_shard]:
+        """Tear down the bucket by freeing the memory.
+        The caller must make sure the current stream has waited for all the flushing streams.
+        """
+        assert self.offset == 0 and self.callbacks == [] and self.slices == [], "Incorrect call of teardown"
+        self.free_events = [None for _ in self.streams]
+        if self.persistent:
+            return
+        for tensor in [self.arena, self.output_shard]:
             tensor.storage().resize_(0)
 
-    def append(self, tensor_list: List[Tensor], callback_fn: Callable):
-        # copy data from input_list into bucket
-        tensor_size = tensor_list[0].numel()
-        stacked_input = torch.stack(tensor_list).view(self.group.size(), tensor_size)
+    def append(self, tensor: Tensor, callback_fn: Callable):
+        # copy data from the flat input into bucket, chunk i of the input goes to row i of the buffer
+        tensor_size = tensor.numel() // self.group.size()
         offset = self.offset
-        self.buffer[:, offset: offset + tensor_size].copy_(stacked_input)
+        self.buffer[:, offset: offset + tensor_size].copy_(tensor.view(self.group.size(), tensor_size))
         self.offset += tensor_size
 
-        # callback will be given the reduced result
+        # callback will be given the reduced result when the bucket is flushed
         if callback_fn is not None:
-            result_view = self.output_shard[offset: offset + tensor_size].view_as(tensor_list[0])
-            self.callbacks.append(functools.partial(callback_fn, result_view))
+            self.callbacks.append(callback_fn)
+            self.slices.append((offset, tensor_size))
 
 
 class ReduceScatterBucketer:
@@ -91,13 +157,13 @@ class ReduceScatterBucketer:
 
         bucketer = ReduceScatterBucketer()
         bucketer.reduce_scatter_async(
-            small_tensors, callback_fn=lambda result: print("small")
+            small_tensor, callback_fn=lambda result: print("small")
         )
         bucketer.reduce_scatter_async(
-            big_tensors, callback_fn=lambda result: print("big")
+            big_tensor, callback_fn=lambda result: print("big")
         )
         bucketer.reduce_scatter_async(
-            more_small_tensors, callback_fn=lambda result: print("small2")
+            more_small_tensor, callback_fn=lambda result: print("small2")
         )
         bucketer.flush()  # callbacks only guaranteed to be called after flush()
         # Example output (note that it is out of order, due to bucketing):
@@ -108,66 +174,80 @@ class ReduceScatterBucketer:
     Args:
         bucket_size_mb (int, Optional): bucket size for communicating. Buckets
             are sub-divided based on world_size. Values <= 0 disable bucketing.
+        streams (List[torch.cuda.Stream], Optional): streams on which bucket
+            flushes are issued round-robin. Each bucket keeps one buffer per
+            stream, so that it is refilled while previous flushes are in
+            flight. Callers must wait for these streams before consuming
+            results or calling ``free()``. If not given, flushes are issued on
+            the current stream.
+        persistent_buffers (bool, Optional): if ``True``, bucket buffers are
+            kept allocated by ``free()``, so they are reused in every backward
+            pass instead of being returned to the caching allocator and
+            competing with activations for its blocks. Defaults to ``False``.
     """
 
-    def __init__(self, bucket_size_mb: int = 25):
+    def __init__(
+        self,
+        bucket_size_mb: int = 25,
+        streams: Optional[List[torch.cuda.Stream]] = None,
+        persistent_buffers: bool = False,
+    ):
         self.bucket_size_mb = bucket_size_mb
-        self.buckets: Dict[Tuple[torch.dtype, torch.device, ProcessGroup], Bucket] = {}
+        self.streams = streams
+        self.persistent_buffers = persistent_buffers
+        self.buckets: Dict[Tuple[torch.dtype, torch.device, ProcessGroup, dist.ReduceOp], Bucket] = {}
 
     @torch.no_grad()
     def reduce_scatter_async(
         self,
-        input_list: List[Tensor],
+        tensor: Tensor,
         group: ProcessGroup,
         callback_fn: Optional[Callable] = None,
+        op: dist.ReduceOp = dist.ReduceOp.SUM,
     ) -> None:
         """
-        Reduce-scatter a list of tensors asynchronously, so smaller reductions
+        Reduce-scatter a flat tensor asynchronously, so smaller reductions
         can be bucketed together. The given callback (``callback_fn``) will be
         called with the reduced result at some later time. Call ``flush()`` to
         force all queued ops and callbacks to be executed.
 
         Note that large inputs will be reduced immediately, and this function
-        may also flush the relevant bucket to make room for ``input_list``.
+        may also flush the relevant bucket to make room for ``tensor``.
 
         Args:
-            input_list (List[Tensor]): list of tensors to reduce-scatter. List
-                should contain ``group.size()`` tensors and each tensor should
-                have identical shape, dtype and device.
+            tensor (Tensor): contiguous 1D tensor to reduce-scatter. Its size
+                should be divisible by ``group.size()``, rank ``i`` gets the
+                reduced result of the ``i``-th equal chunk.
             group (ProcessGroup): process group for reduction
             callback_fn (Callable, Optional): callback function to call after
                 the reduction executes. Function will be called with a single
                 argument corresponding to the reduced result.
+            op (ReduceOp, Optional): reduction op, e.g. ``ReduceOp.AVG`` to
+                average inside the collective. Inputs with different ops are
+                never bucketed together. Defaults to ``ReduceOp.SUM``.
         """
         world_size = group.size()
 
         assert (
-            len(input_list) == world_size
-        ), f"reduce_scatter received {len(input_list)} inputs, expected group.size() ({world_size})"
+            tensor.dim() == 1 and tensor.numel() % world_size == 0
+        ), f"reduce_scatter received a tensor of shape {tuple(tensor.shape)}, expected 1D and divisible by {world_size}"
 
-        first_input = input_list[0]
-        first_input_size = first_input.numel()
+        shard_size = tensor.numel() // world_size
 
-        bucket_shard_size = self._get_shard_size(first_input.element_size(), world_size)
-        if first_input_size > bucket_shard_size:
-            # TODO: investigate how to avoid using torch.cat (because it seems to be slow for CPU tensors)
+        bucket_shard_size = self._get_shard_size(tensor.element_size(), world_size)
+        if shard_size > bucket_shard_size:
             # input is too big to fit in the bucket, reduce-scatter directly
-            output = torch.zeros_like(input_list[0])
-            if hasattr(dist, "_reduce_scatter_base") and enable_nccl_base_collectives:
-                input_flattened = torch.cat(input_list)
-                dist._reduce_scatter_base(output, input_flattened, group=group)
-            else:
-                # fallback
-                dist.reduce_scatter(output, input_list, group=group)
+            output = tensor.new_zeros(shard_size)
+            _reduce_scatter_flat(output, tensor, group, op)
             if callback_fn is not None:
                 callback_fn(output)
             return
 
-        bucket = self._get_bucket(first_input, group)
-        if first_input_size > bucket.buffer.size(1) - bucket.offset:
+        bucket = self._get_bucket(tensor, group, op)
+        if shard_size > bucket.buffer.size(1) - bucket.offset:
             # not enough space remaining in bucket, flush it now
             bucket.flush()
-        bucket.append(input_list, callback_fn)
+        bucket.append(tensor, callback_fn)
 
     @torch.no_grad()
     def flush(self) -> None:
@@ -189,12 +269,14 @@ class ReduceScatterBucketer:
         bucket_size = self.bucket_size_mb * MB / element_size
         return int(bucket_size // num_shards)
 
-    def _get_bucket(self, tensor: Tensor, group: ProcessGroup) -> Bucket:
-        key = (tensor.dtype, tensor.device, group)
+    def _get_bucket(self, tensor: Tensor, group: ProcessGroup, op: dist.ReduceOp) -> Bucket:
+        key = (tensor.dtype, tensor.device, group, op)
         if key not in self.buckets:
             # buckets are divided into world_size pieces, bucket.data shaped (world_size, shard_size)
             world_size = group.size()
             shard_size = self._get_shard_size(tensor.element_size(), world_size)
-            self.buckets[key] = Bucket(shard_size, tensor.dtype, tensor.device, group)
+            self.buckets[key] = Bucket(
+                shard_size, tensor.dtype, tensor.device, group, self.streams, op, self.persistent_buffers
+            )
         self.buckets[key].alloc()
         return self.buckets[key]
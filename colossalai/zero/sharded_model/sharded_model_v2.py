@@ -1,6 +1,7 @@
 import functools
+import math
 from collections import OrderedDict
-from typing import Any, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import torch
 import torch.distributed as dist
@@ -19,8 +20,8 @@ from colossalai.zero.sharded_model.reduce_scatter import ReduceScatterBucketer
 from torch.distributed import ProcessGroup
 from torch.nn.parameter import Parameter
 
-from ._utils import (cast_float_arguments, cast_tensor_to_fp16, cast_tensor_to_fp32, chunk_and_pad, free_storage,
-                     get_gradient_predivide_factor)
+from ._utils import (FreeEventQueue, cast_float_arguments_to_fp16, cast_tensor_list_to_fp32, chunk_and_pad,
+                     free_storage, get_gradient_predivide_factor, nccl_supports_avg)
 
 
 class ShardedModelV2(nn.Module):
@@ -40,6 +41,7 @@ class ShardedModelV2(nn.Module):
         reduce_scatter_bucket_size_mb (int, optional): Reduce-scatter bucket size in *MB*. Defaults to 25.
         fp32_reduce_scatter (bool, optional): If set to `True`, gradients are forced to FP32 before reduce-scatter. Defaults to False.
         offload_config (Optional[dict], optional): We currently only support CPU offload. Set to `{"device": "cpu"}` to enable CPU offload. Defaults to None.
+            Grads are offloaded asynchronously, call `wait_grad_offload()` before reading them outside `ShardedOptimizerV2`.
         gradient_predivide_factor (Optional[float], optional): Gradient is divived by this value before reduce-scatter. Defaults to 1.0.
         use_memory_tracer (bool, optional): Whether to use memoty tracer. Defaults to False.
         reuse_fp16_shard (bool, optional): Whether to reuse fp16 shard for param and grad. 
@@ -47,6 +49,14 @@ class ShardedModelV2(nn.Module):
             In this mode, grad will be fp16. Make sure your optimizer supports mixed precision (fp32 param and fp16 grad). 
             We find that PyTorch's optimizers don't support mixed precision, 
             so we recommend you enable this only when using our CPUAdam with CPU offload. Defaults to False.
+        grad_sync_dtype (Optional[torch.dtype], optional): If set, grads are cast to this dtype before reduce-scatter,
+            and cast back to the dtype of param afterwards. It takes precedence over `fp32_reduce_scatter`.
+            `torch.bfloat16` halves the communication volume of FP32 reduce-scatter, and doesn't overflow as FP16 does.
+            It falls back to None if bf16 is not supported on the device. Defaults to None.
+        persistent_reduce_scatter_buffers (bool, optional): Whether to keep the reduce-scatter buckets and the slabs
+            staging their inputs allocated after backward. They are then reused in every iteration instead of being
+            returned to the caching allocator, which reduces fragmentation, at the cost of holding them
+            during forward. Defaults to False.
     """
 
     def __init__(self,
@@ -59,7 +69,9 @@ class ShardedModelV2(nn.Module):
                  offload_config: Optional[dict] = None,
                  gradient_predivide_factor: Optional[float] = 1.0,
                  use_memory_tracer: bool = False,
-                 reuse_fp16_shard: bool = False):
+                 reuse_fp16_shard: bool = False,
+                 grad_sync_dtype: Optional[torch.dtype] = None,
+                 persistent_reduce_scatter_buffers: bool = False):
         super().__init__()
         self.logger = get_dist_logger()
 
@@ -74,6 +86,11 @@ class ShardedModelV2(nn.Module):
             unsharded), 'Parameters must be all sharded or all unsharded! Parameters are partially sharded now.'
         self.shard_param = all(sharded)
         self.module = module
+        # Params and their sharded attributes are materialized once as parallel lists,
+        # so that hot loops neither walk the module nor chain attribute lookups
+        self._params: List[Parameter] = list(module.parameters())
+        self._col_attrs = [p.col_attr for p in self._params]
+        self._sharded_tensors = [col_attr.sharded_data_tensor for col_attr in self._col_attrs]
 
         self.process_group = process_group or gpc.get_group(ParallelMode.DATA)
         self.reduce_scatter_process_group = reduce_scatter_process_group or self.process_group
@@ -91,16 +108,27 @@ class ShardedModelV2(nn.Module):
         self._iter_cnter = 0
 
         # Register hooks
-        self._ophook_list = [ZeroHook(self.shard_strategy, self._memstats_collector, self.process_group)]
+        # Params of the next module in backward are prefetched on `_allgather_stream`,
+        # which is distinct from `comm_stream` where gradients are reduce-scattered
+        self._allgather_stream: torch.cuda.Stream = torch.cuda.Stream()
+        self._ophook_list = [
+            ZeroHook(self.shard_strategy, self._memstats_collector, self.process_group, self._allgather_stream)
+        ]
         register_ophooks_recursively(self.module, self._ophook_list)
-        self.param_hook_mgr = BaseParamHookMgr(list(self.module.parameters()))
+        self.param_hook_mgr = BaseParamHookMgr(self._params)
         self.param_hook_mgr.register_backward_hooks(self._grad_post_backward_hook)
 
         self.fp32_reduce_scatter = fp32_reduce_scatter
+        if grad_sync_dtype is torch.bfloat16 and not (hasattr(torch.cuda, 'is_bf16_supported')
+                                                      and torch.cuda.is_bf16_supported()):
+            self.logger.warning('bf16 is not supported on the current device, grad_sync_dtype is set to None',
+                                ranks=[0])
+            grad_sync_dtype = None
+        self.grad_sync_dtype: Optional[torch.dtype] = grad_sync_dtype
         self._cpu_offload: bool = offload_config.get('device', None) == 'cpu' if offload_config else False
-        for param in module.parameters():
+        for col_attr in self._col_attrs:
             # Init `offload_grad`
-            param.col_attr.offload_grad = self._cpu_offload
+            col_attr.offload_grad = self._cpu_offload
 
         # We find if gradient_predivide_factor != 1.0, there may be wrong precision problem
         # So we use 1.0 as the default gradient_predivide_factor
@@ -110,14 +138,88 @@ class ShardedModelV2(nn.Module):
             gradient_predivide_factor is not None else \
             get_gradient_predivide_factor(self.world_size)
         self.gradient_postdivide_factor: float = self.world_size / self.gradient_predivide_factor
-
+        # If grads are only averaged by the size of the reduce-scatter group after the sum,
+        # NCCL can average them inside the reduce-scatter kernel, which saves a pass over the reduced grads
+        self._rs_reduce_op: dist.ReduceOp = dist.ReduceOp.SUM
+        if self.gradient_predivide_factor == 1.0 and self.world_size > 1 and \
+                self.gradient_postdivide_factor == self.reduce_scatter_process_group.size() and \
+                nccl_supports_avg(self.reduce_scatter_process_group):
+            self._rs_reduce_op = dist.ReduceOp.AVG
+
+        # Grads are staged and copied into reduce-scatter buckets on `comm_stream`,
+        # while bucket flushes are issued round-robin on `_rs_pipeline_streams`,
+        # so a bucket can be refilled while the reduce-scatter of the previous one is in flight
         self.comm_stream: torch.cuda.Stream = torch.cuda.Stream()
-        self.reducer = ReduceScatterBucketer(reduce_scatter_bucket_size_mb)
+        self._rs_pipeline_size = 2
+        self._rs_pipeline_streams = [torch.cuda.Stream() for _ in range(self._rs_pipeline_size)]
+        self._persistent_rs_buffers = persistent_reduce_scatter_buffers
+        self.reducer = ReduceScatterBucketer(reduce_scatter_bucket_size_mb,
+                                             streams=self._rs_pipeline_streams,
+                                             persistent_buffers=persistent_reduce_scatter_buffers)
         self._require_backward_grad_sync: bool = True
 
+        # Grads are copied into preallocated slabs before reduce-scatter instead of being cloned one by one.
+        # Slabs are sized to the largest padded grad and rotate, so a slab is reused only after
+        # the ops reading it on `comm_stream` are done.
+        self._max_num_inflight_rs = 2
+        rs_world_size = self.reduce_scatter_process_group.size()
+        self._rs_slab_numel = max(
+            (math.ceil(t.origin_numel / rs_world_size) * rs_world_size for t in self._sharded_tensors), default=0)
+        self._rs_slab_queue = FreeEventQueue(self._max_num_inflight_rs)
+        self._rs_slab_in_use: Optional[torch.Tensor] = None
+        # Grads read on `comm_stream` are held with the event recorded after the read, see `_hold_inflight_grads`
+        self._inflight_rs_grads = FreeEventQueue(self._max_num_inflight_rs)
+        self._empty_grad_templates: Dict[tuple, torch.Tensor] = {}
+
+        # Grads are submitted to the reducer layer by layer, a layer being the params owned by a module,
+        # in the forward order recorded by `ZeroHook` in the first iteration. As the backward hooks of params
+        # don't fire in a strict order, grads of a layer are held until all of them have arrived,
+        # so that a bucket is filled with whole layers instead of params of unrelated layers.
+        self._fwd_layer_order: Optional[List[List[Parameter]]] = None
+        self._param_fwd_layer: Dict[Parameter, int] = {}
+        self._pending_layer_grads: Dict[int, List[Tuple[Parameter, torch.Tensor]]] = {}
+
         self._cuda_margin_space = 0
         self.reuse_fp16_shard = reuse_fp16_shard
 
+        # Updated param shards are copied back to CUDA asynchronously after optimizer step, see `on_step_end`
+        self._h2d_stream: Optional[torch.cuda.Stream] = torch.cuda.Stream() if self._cpu_offload else None
+        self._h2d_done: Optional[torch.cuda.Event] = None
+        self._param_h2d_staging: Optional[torch.Tensor] = None
+
+        # Offloaded grads are waited for by their consumers, see `wait_grad_offload`
+        self._d2h_done: Optional[torch.cuda.Event] = None
+        self._d2h_src_grads: List[torch.Tensor] = []
+
+        # Per-grad steps of `_grad_post_backward_hook`, specialized for the flags fixed above
+        self._reduce_scatter_callback = self._make_reduce_scatter_callback()
+        self._reduce_scatter_grad = self._make_reduce_scatter_grad_fn()
+        if self._cpu_offload:
+            self._init_grad_cpu_pool()
+
+    def _init_grad_cpu_pool(self) -> None:
+        """Allocate a pinned CPU buffer holding the local grad shards of all params, so that grads can be offloaded
+        with asynchronous copies. Each param which requires grad gets a flat slot of the pool.
+        """
+        rs_world_size = self.reduce_scatter_process_group.size()
+        grad_shard_numels: List[int] = []
+        for p, t in zip(self._params, self._sharded_tensors):
+            if not p.requires_grad:
+                grad_shard_numels.append(0)
+                continue
+            grad_shard_numels.append(
+                math.ceil(t.origin_numel / rs_world_size) if self.world_size > 1 else t.origin_numel)
+        # Grads are fp32 when offloaded, except that the fp16 shard is reused
+        dtype = self._params[0].dtype if self.reuse_fp16_shard else torch.float32
+        self._grad_cpu_pool = torch.empty(sum(grad_shard_numels), dtype=dtype, pin_memory=True)
+        # Slots are aligned with `_params`, None for params without grad
+        self._grad_cpu_pool_slots: List[Optional[torch.Tensor]] = []
+        offset = 0
+        for p, numel in zip(self._params, grad_shard_numels):
+            self._grad_cpu_pool_slots.append(self._grad_cpu_pool.narrow(0, offset, numel) if p.requires_grad else None)
+            offset += numel
+        self._d2h_stream: torch.cuda.Stream = torch.cuda.Stream()
+
     @property
     def cuda_margin_space(self):
         return self._cuda_margin_space
@@ -130,10 +232,65 @@ class ShardedModelV2(nn.Module):
         if self._iter_cnter == 0 and self._memstats_collector:
             # the opeartion will affect the flag in ZeroHook
             self._memstats_collector.start_collection()
-        args, kwargs = cast_float_arguments(cast_tensor_to_fp16, *args, **kwargs)
+        self._wait_param_h2d()
+        args, kwargs = cast_float_arguments_to_fp16(*args, **kwargs)
         outputs = self.module(*args, **kwargs)
         return outputs
 
+    def on_step_end(self, params: List[Parameter]) -> List[Parameter]:
+        """Called by the sharded optimizer after the inner optimizer steps, while `p.data` of each param is
+        its updated fp32 shard. Shards on CPU are cast into a pinned staging buffer and copied to
+        their fp16 payloads on CUDA asynchronously on `_h2d_stream`.
+        The current stream waits for the copies on the GPU instead of blocking the host.
+
+        Args:
+            params (List[Parameter]): params updated by the optimizer.
+
+        Returns:
+            List[Parameter]: params whose payloads are being updated here. Others must be updated by the caller.
+        """
+        if not self._cpu_offload:
+            return []
+        h2d_params = []
+        for p in params:
+            payload = p.col_attr.sharded_data_tensor.payload
+            if p.col_attr.sharded_data_tensor.is_sharded and payload.is_cuda and payload.dtype == torch.float16 \
+                    and p.data.device.type == 'cpu':
+                h2d_params.append(p)
+        if len(h2d_params) == 0:
+            return []
+        # The staging buffer can't be overwritten before the previous copies are done
+        self._wait_param_h2d(blocking=True)
+        numel = sum(p.col_attr.sharded_data_tensor.payload.numel() for p in h2d_params)
+        if self._param_h2d_staging is None or self._param_h2d_staging.numel() < numel:
+            self._param_h2d_staging = torch.empty(numel, dtype=torch.float16, pin_memory=True)
+        # Payloads may still be read by kernels on the compute stream
+        self._h2d_stream.wait_stream(torch.cuda.current_stream())
+        offset = 0
+        with torch.cuda.stream(self._h2d_stream):
+            for p in h2d_params:
+                payload = p.col_attr.sharded_data_tensor.payload
+                staging = self._param_h2d_staging.narrow(0, offset, payload.numel()).view_as(payload)
+                staging.copy_(p.data.view_as(payload))
+                payload.copy_(staging, non_blocking=True)
+                offset += payload.numel()
+        self._h2d_done = torch.cuda.Event()
+        self._h2d_done.record(self._h2d_stream)
+        # Params may be read right after optimizer step, e.g. for evaluation or EMA
+        self._wait_param_h2d()
+        return h2d_params
+
+    def _wait_param_h2d(self, blocking: bool = False) -> None:
+        """Wait for param shards copied by `on_step_end`.
+        By default only the current stream waits, if `blocking` is True, the host waits.
+        """
+        if self._h2d_done is None:
+            return
+        if blocking:
+            self._h2d_done.synchronize()
+        else:
+            torch.cuda.current_stream().wait_event(self._h2d_done)
+
     def backward(self, loss):
         loss.backward()
         self._post_backward_operations()
@@ -151,14 +308,17 @@ class ShardedModelV2(nn.Module):
             self._memstats_collector.finish_collection()
             self.logger.info(f'model data cuda, {self._memstats_collector.model_data_cuda}')
             self.logger.info(f'non-model data cuda, {self._memstats_collector.non_model_data_cuda}')
-
-        if self._memstats_collector:
             self._memstats_collector.reset_sampling_cnter()
             # cuda margin space = cuda mem capacity - max fwd/bwd cuda mem used.
             # the way to calculate margin space is based on the assumption that
             # model data is fixed in cuda during training.
             # cuda margin space can be used to store OS.
             self._cuda_margin_space = colo_cuda_memory_capacity() - max(self._memstats_collector.overall_cuda)
+            # only the stats of the first iteration are used,
+            # stop sampling in the hooks so that later iterations don't pay for it
+            for ophook in self._ophook_list:
+                if isinstance(ophook, ZeroHook):
+                    ophook.detach_memstats_collector()
         self._iter_cnter += 1
 
     @torch.no_grad()
@@ -166,27 +326,38 @@ class ShardedModelV2(nn.Module):
         """
         The method includes operations required to be processed after backward
         """
+        # Grads offloaded in the last backward may be accumulated into, and their slots are rewritten
+        self.wait_grad_offload()
         self._update_memstats()
 
         if self._require_backward_grad_sync:
+            # Submit the grads of layers which are not complete, e.g. some of their params are unused
+            for layer_idx in list(self._pending_layer_grads.keys()):
+                self._flush_layer_grads(layer_idx)
             # Flush any unreduced buckets in the post_backward stream.
             with torch.cuda.stream(self.comm_stream):
                 self.reducer.flush()
             torch.cuda.current_stream().wait_stream(self.comm_stream)
-            if self._cpu_offload:
-                # Wait for the non-blocking GPU -> CPU grad transfers to finish.
-                torch.cuda.current_stream().synchronize()
+        for stream in self._rs_pipeline_streams:
+            torch.cuda.current_stream().wait_stream(stream)
         self.reducer.free()
+        # All the grads have been read
+        self._inflight_rs_grads.clear()
+        if not self._persistent_rs_buffers:
+            # Release the slabs, so that the memory can be used by the forward pass
+            self._rs_slab_queue.clear()
         # In case some post bwd hook is not fired
+        # Params may have been prefetched but not used, so wait for the all-gather stream first
+        torch.cuda.current_stream().wait_stream(self._allgather_stream)
         if self.shard_param:
-            tensor_list = []
-            for p in self.module.parameters():
-                if not p.col_attr.param_is_sharded:
-                    tensor_list.append(p.col_attr.sharded_data_tensor)
+            tensor_list = [t for t in self._sharded_tensors if not t.is_sharded]
             self.shard_strategy.shard(tensor_list, self.process_group)
-        for p in self.module.parameters():
-            p.col_attr.bwd_count = 0
-            if not p.requires_grad:
+        params, col_attrs = self._params, self._col_attrs
+        # Indices of params whose grads are synchronized in this pass
+        sync_ids: List[int] = []
+        for i, col_attr in enumerate(col_attrs):
+            col_attr.bwd_count = 0
+            if not params[i].requires_grad:
                 continue
             # Leave the gradient accumulation state as-is if not synchronizing this pass. This ensures p.grad
             # remains the unsharded gradient accumulated from prior no-sync passes, and _saved_grad_shard
@@ -194,26 +365,99 @@ class ShardedModelV2(nn.Module):
             # sync passes, if desired.
             if not self._require_backward_grad_sync:
                 continue
-            # Write grad back to p.grad and set p.col_attr.grad to None
-            # As sharded optimizer only update a shard of param,
-            # no matter whether we shard param in sharded model
-            # We have to make sure the grad is a flat tensor shard
-            # If world size == 1 and sharded param,
-            # the shape `grad` is the same as unsharded param
-            # So we can just use `view(-1)` to ensure grad is a flat tensor shard
-            if self.reuse_fp16_shard:
-                grad_payload = p.col_attr.sharded_data_tensor.payload
-            else:
-                grad_payload = cast_tensor_to_fp32(p.col_attr.fp16_grad)
-            if p.col_attr.offload_grad:
-                grad_payload = colo_model_tensor_clone(grad_payload, torch.device('cpu'))
-            if p.col_attr.fp32_grad is not None:
-                assert not self.reuse_fp16_shard, 'Gradien accumulation is not supported when reuse_fp16_shard=True'
-                p.col_attr.fp32_grad.add_(grad_payload.view_as(p.col_attr.fp32_grad))
-                grad_payload = p.col_attr.fp32_grad
-            p.grad.data = grad_payload
-            p.col_attr.fp16_grad = None
-            p.col_attr.fp32_grad = None
+            sync_ids.append(i)
+        # Write grad back to p.grad and set p.col_attr.grad to None
+        # As sharded optimizer only update a shard of param,
+        # no matter whether we shard param in sharded model
+        # We have to make sure the grad is a flat tensor shard
+        # If world size == 1 and sharded param,
+        # the shape `grad` is the same as unsharded param
+        # So we can just use `view(-1)` to ensure grad is a flat tensor shard
+        # Grads are cast, accumulated and offloaded as lists, so that casting and accumulation
+        # are batched into multi-tensor kernels
+        if self.reuse_fp16_shard:
+            grad_payloads = [self._sharded_tensors[i].payload for i in sync_ids]
+        else:
+            grad_payloads = cast_tensor_list_to_fp32([col_attrs[i].fp16_grad for i in sync_ids])
+        if self._cpu_offload:
+            grad_payloads = self._offload_grads(sync_ids, grad_payloads)
+        accum_grads, accum_payloads = [], []
+        for j, i in enumerate(sync_ids):
+            fp32_grad = col_attrs[i].fp32_grad
+            if fp32_grad is not None:
+                accum_grads.append(fp32_grad)
+                accum_payloads.append(grad_payloads[j].view_as(fp32_grad))
+                grad_payloads[j] = fp32_grad
+        if len(accum_grads) > 0:
+            assert not self.reuse_fp16_shard, 'Gradien accumulation is not supported when reuse_fp16_shard=True'
+            torch._foreach_add_(accum_grads, accum_payloads)
+        for i, grad_payload in zip(sync_ids, grad_payloads):
+            params[i].grad.data = grad_payload
+            col_attrs[i].fp16_grad = None
+            col_attrs[i].fp32_grad = None
+        if self._fwd_layer_order is None:
+            self._init_fwd_layers()
+
+    def _init_fwd_layers(self) -> None:
+        """Group params by the module owning them, in the forward order recorded in the first iteration.
+        """
+        self._fwd_layer_order = []
+        if self.world_size == 1:
+            # Grads aren't reduce-scattered, there is nothing to bucket
+            return
+        for ophook in self._ophook_list:
+            if not isinstance(ophook, ZeroHook):
+                continue
+            for module in ophook.fwd_module_order:
+                layer = [
+                    p for p in module.parameters(recurse=False) if p.requires_grad and p not in self._param_fwd_layer
+                ]
+                if len(layer) == 0:
+                    continue
+                for p in layer:
+                    self._param_fwd_layer[p] = len(self._fwd_layer_order)
+                self._fwd_layer_order.append(layer)
+
+    def _offload_grads(self, param_ids: List[int], grad_payloads: List[torch.Tensor]) -> List[torch.Tensor]:
+        """Move grads of params with `offload_grad` to CPU.
+        Grads are copied into their slots of the pinned CPU pool asynchronously on `_d2h_stream`,
+        and we only wait for an event recorded after the last copy.
+        A grad falls back to a blocking copy if it is accumulated into an existing grad,
+        as its slot may be the accumulated grad itself.
+        """
+        self._d2h_stream.wait_stream(torch.cuda.current_stream())
+        cpu_grad_payloads = []
+        with torch.cuda.stream(self._d2h_stream):
+            for i, grad_payload in zip(param_ids, grad_payloads):
+                col_attr = self._col_attrs[i]
+                if not col_attr.offload_grad:
+                    cpu_grad_payloads.append(grad_payload)
+                    continue
+                pinned_slot = self._grad_cpu_pool_slots[i]
+                if col_attr.fp32_grad is None and pinned_slot is not None \
+                        and pinned_slot.dtype == grad_payload.dtype and pinned_slot.numel() == grad_payload.numel():
+                    pinned_slot.copy_(grad_payload.view(-1), non_blocking=True)
+                    cpu_grad_payloads.append(pinned_slot)
+                else:
+                    cpu_grad_payloads.append(colo_model_tensor_clone(grad_payload, torch.device('cpu')))
+        # We don't wait for the non-blocking GPU -> CPU grad transfers here,
+        # only consumers of CPU grads do, see `wait_grad_offload`.
+        # CUDA grads in `grad_payloads` are kept alive until then.
+        self._d2h_done = torch.cuda.Event()
+        self._d2h_done.record(self._d2h_stream)
+        self._d2h_src_grads = grad_payloads
+        return cpu_grad_payloads
+
+    def wait_grad_offload(self) -> None:
+        """Wait for the asynchronous GPU -> CPU grad transfers issued in the last backward.
+        With CPU offload, `p.grad` must not be read before calling this method.
+        `ShardedOptimizerV2` calls it before using grads.
+        """
+        if self._d2h_done is None:
+            return
+        self._d2h_done.synchronize()
+        self._d2h_done = None
+        self._d2h_src_grads = []
 
     @torch.no_grad()
     def _grad_post_backward_hook(self, param: Parameter, grad: torch.Tensor) -> Optional[torch.Tensor]:
@@ -241,51 +485,177 @@ class ShardedModelV2(nn.Module):
         assert not grad.requires_grad, 'ShardedModel only works with gradients that don\'t require gradients'
         if not self._require_backward_grad_sync:
             return
+        layer_idx = self._param_fwd_layer.get(param)
+        if layer_idx is None:
+            self._reduce_scatter_grads([(param, grad)])
+        else:
+            self._stage_layer_grad(layer_idx, param, grad)
+        return self._get_empty_grad(grad)
+
+    def _stage_layer_grad(self, layer_idx: int, param: Parameter, grad: torch.Tensor) -> None:
+        pending = self._pending_layer_grads.setdefault(layer_idx, [])
+        if any(p is param for p, _ in pending):
+            # The grad of a param may arrive more than once in a backward pass, e.g. with activation checkpointing
+            self._flush_layer_grads(layer_idx)
+            pending = self._pending_layer_grads.setdefault(layer_idx, [])
+        pending.append((param, grad))
+        if len(pending) == len(self._fwd_layer_order[layer_idx]):
+            self._flush_layer_grads(layer_idx)
+
+    def _flush_layer_grads(self, layer_idx: int) -> None:
+        self._reduce_scatter_grads(self._pending_layer_grads.pop(layer_idx))
+
+    def _reduce_scatter_grads(self, param_grads: List[Tuple[Parameter, torch.Tensor]]) -> None:
         self.comm_stream.wait_stream(torch.cuda.current_stream())
         with torch.cuda.stream(self.comm_stream):
-            new_grad = grad.clone()
-            if self.fp32_reduce_scatter:
-                new_grad.data = new_grad.data.to(param.dtype)
-            if self.gradient_predivide_factor > 1.0:
-                # Average grad by world_size for consistency with PyTorch DDP.
-                new_grad.data.div_(self.gradient_predivide_factor)
-            orig_grad_data = new_grad.data
-            if self.world_size > 1:
-                grad_chunks = chunk_and_pad(orig_grad_data, self.reduce_scatter_process_group.size())
-                self.reducer.reduce_scatter_async(grad_chunks,
-                                                  group=self.reduce_scatter_process_group,
-                                                  callback_fn=functools.partial(self._reduce_scatter_callback, param))
+            read_events = [self._reduce_scatter_grad(param, grad) for param, grad in param_grads]
+        # We don't make the compute stream wait for the reduce-scatter here, so that backward compute
+        # and the all-gather of the next module can overlap with it.
+        # Reduced grads are only consumed after `_post_backward_operations` waits for `comm_stream`.
+        for (_, grad), read_done in zip(param_grads, read_events):
+            self._hold_inflight_grad(read_done, grad)
+
+    def _hold_inflight_grad(self, read_done: torch.cuda.Event, grad: torch.Tensor) -> None:
+        """Keep a grad read on `comm_stream` alive until ``read_done``, instead of marking it by `record_stream`.
+        Grads are allocated on the compute stream, their memory is only reused by it once they are dropped.
+        So the compute stream waits for the oldest in-flight grad to be read before dropping it.
+        ``read_done`` is recorded right after the read, before `comm_stream` waits for any bucket flush,
+        so that the compute stream doesn't wait for reduce-scatters.
+        """
+        freed = self._inflight_rs_grads.dequeue_if_needed()
+        if freed is not None:
+            torch.cuda.current_stream().wait_event(freed[0])
+        self._inflight_rs_grads.enqueue(read_done, grad)
+
+    def _make_reduce_scatter_grad_fn(self) -> Callable[[Parameter, torch.Tensor], torch.cuda.Event]:
+        """Build the step of :func:`_reduce_scatter_grads` applied to each grad on `comm_stream`,
+        which returns an event recorded once the grad is read.
+        It depends on flags fixed after construction, so the branches on them are resolved once here
+        instead of for every grad in every backward pass.
+        Inputs of the reduce-scatter are allocated on `comm_stream`, which is the only stream reading them.
+        """
+        callback = self._reduce_scatter_callback
+        fp32_reduce_scatter = self.fp32_reduce_scatter
+        # Average grad by world_size for consistency with PyTorch DDP.
+        predivide_factor = self.gradient_predivide_factor if self.gradient_predivide_factor > 1.0 else None
+
+        if self.world_size == 1:
+
+            def reduce_scatter_grad(param: Parameter, grad: torch.Tensor) -> torch.cuda.Event:
+                # The grad is kept as the local grad shard, so it can't live in a slab
+                new_grad = grad.clone()
+                read_done = torch.cuda.Event()
+                read_done.record()
+                if fp32_reduce_scatter:
+                    new_grad.data = new_grad.data.to(param.dtype)
+                if predivide_factor is not None:
+                    new_grad.data.div_(predivide_factor)
+                callback(param, new_grad)
+                return read_done
+
+            return reduce_scatter_grad
+
+        reducer, rs_op = self.reducer, self._rs_reduce_op
+        rs_group = self.reduce_scatter_process_group
+        rs_world_size = rs_group.size()
+        get_slab, release_slab = self._get_rs_input_slab, self._release_rs_input_slab
+        grad_sync_dtype = self.grad_sync_dtype
+
+        def reduce_scatter_grad(param: Parameter, grad: torch.Tensor) -> torch.cuda.Event:
+            if grad_sync_dtype is not None:
+                rs_dtype = grad_sync_dtype
             else:
-                self._reduce_scatter_callback(param, new_grad)
-            orig_grad_data.record_stream(self.comm_stream)
-        torch.cuda.current_stream().wait_stream(self.comm_stream)
-        empty_grad = torch.empty_like(grad)
-        free_storage(empty_grad)
-        return empty_grad
-
-    def _reduce_scatter_callback(self, param: Parameter, reduced_grad: torch.Tensor) -> None:
-        reduced_grad = reduced_grad.view(-1)
-        if self.gradient_postdivide_factor > 1:
+                rs_dtype = param.dtype if fp32_reduce_scatter else grad.dtype
+            # The grad is flattened and padded in a slab, as it is copied into the reduce-scatter bucket right after
+            new_grad = chunk_and_pad(grad, rs_world_size, out=get_slab(rs_dtype))
+            read_done = torch.cuda.Event()
+            read_done.record()
+            if predivide_factor is not None:
+                new_grad.div_(predivide_factor)
+            reducer.reduce_scatter_async(new_grad,
+                                         group=rs_group,
+                                         op=rs_op,
+                                         callback_fn=functools.partial(callback, param))
+            release_slab()
+            return read_done
+
+        return reduce_scatter_grad
+
+    def _get_empty_grad(self, grad: torch.Tensor) -> torch.Tensor:
+        """Get a tensor with the same metadata as `grad` but without storage, which is returned to autograd
+        in place of the reduced grad.
+        A storage-free template is created once per (shape, stride, dtype, device),
+        and each call returns a detached alias of it, which neither allocates nor shares the tensor object.
+        """
+        key = (grad.shape, grad.stride(), grad.dtype, grad.device)
+        template = self._empty_grad_templates.get(key)
+        if template is None:
+            template = torch.empty_like(grad)
+            free_storage(template)
+            self._empty_grad_templates[key] = template
+        return template.detach()
+
+    def _get_rs_input_slab(self, dtype: torch.dtype) -> torch.Tensor:
+        """Get a flat slab on `comm_stream` to stage a reduce-scatter input.
+        If all slabs are in flight, `comm_stream` waits for the oldest one to be released.
+        """
+        freed = self._rs_slab_queue.dequeue_if_needed()
+        if freed is not None:
+            free_event, slab = freed
+            self.comm_stream.wait_event(free_event)
+        if freed is None or slab.dtype != dtype:
+            slab = torch.empty(self._rs_slab_numel, dtype=dtype, device=torch.cuda.current_device())
+        self._rs_slab_in_use = slab
+        return slab
+
+    def _release_rs_input_slab(self) -> None:
+        """Mark the slab in use as consumed by all the ops enqueued on `comm_stream` so far."""
+        free_event = torch.cuda.Event()
+        free_event.record(self.comm_stream)
+        self._rs_slab_queue.enqueue(free_event, self._rs_slab_in_use)
+        self._rs_slab_in_use = None
+
+    def _make_reduce_scatter_callback(self) -> Callable[[Parameter, torch.Tensor], None]:
+        """Build the callback receiving the reduced grad shard of a param, specialized like
+        :func:`_make_reduce_scatter_grad_fn`.
+        """
+        postdivide_factor = None
+        if self.gradient_postdivide_factor > 1 and self._rs_reduce_op != dist.ReduceOp.AVG:
             # Average grad by world_size for consistency with PyTorch DDP.
-            reduced_grad.data.div_(self.gradient_postdivide_factor)
+            postdivide_factor = self.gradient_postdivide_factor
+        cast_back = self.grad_sync_dtype is not None
+
         if self.reuse_fp16_shard:
-            param.col_attr.sharded_data_tensor.reset_payload(reduced_grad.data)
-            param.col_attr.sharded_data_tensor.is_sharded = True
+
+            def set_grad(param: Parameter, reduced_grad: torch.Tensor) -> None:
+                param.col_attr.sharded_data_tensor.reset_payload(reduced_grad.data)
+                param.col_attr.sharded_data_tensor.is_sharded = True
         else:
-            param.col_attr.fp16_grad = reduced_grad.data
+
+            def set_grad(param: Parameter, reduced_grad: torch.Tensor) -> None:
+                param.col_attr.fp16_grad = reduced_grad.data
+
+        def reduce_scatter_callback(param: Parameter, reduced_grad: torch.Tensor) -> None:
+            reduced_grad = reduced_grad.view(-1)
+            if postdivide_factor is not None:
+                reduced_grad.data.div_(postdivide_factor)
+            if cast_back and reduced_grad.dtype != param.dtype:
+                # Cast back after averaging, as the summed grad may overflow in the dtype of param
+                reduced_grad = reduced_grad.to(param.dtype)
+            set_grad(param, reduced_grad)
+
+        return reduce_scatter_callback
 
     def state_dict(self, destination=None, prefix='', keep_vars=False) -> 'OrderedDict[str, torch.Tensor]':
-        self.shard_strategy.gather([p.col_attr.sharded_data_tensor for p in self.module.parameters()],
-                                   self.process_group)
-        prev_params = {}
-        for p in self.module.parameters():
-            prev_params[p] = p.data
-            p.data = p.col_attr.sharded_data_tensor.payload
+        self._wait_param_h2d()
+        self.shard_strategy.gather(self._sharded_tensors, self.process_group)
+        prev_data = [p.data for p in self._params]
+        for p, t in zip(self._params, self._sharded_tensors):
+            p.data = t.payload
         gathered_state_dict = self.module.state_dict(destination, prefix, keep_vars)
-        self.shard_strategy.shard([p.col_attr.sharded_data_tensor for p in self.module.parameters()],
-                                  self.process_group)
-        for p in self.module.parameters():
-            p.data = prev_params[p]
+        self.shard_strategy.shard(self._sharded_tensors, self.process_group)
+        for p, data in zip(self._params, prev_data):
+            p.data = data
         return gathered_state_dict
 
     def load_state_dict(self, state_dict: 'OrderedDict[str, torch.Tensor]', strict: bool = True):
@@ -120,6 +120,8 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
                     self.shard_strategy.gather([p.col_attr.sharded_data_tensor], self.dp_process_group)
 
     def step(self, *args, **kwargs):
+        # Grads may still be being offloaded to CPU
+        self.model.wait_grad_offload()
         self._maybe_move_fp32_shards()
 
         # unscale grads if scaled
@@ -145,10 +147,15 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
         ret = self.optim.step(*args, **kwargs)
 
         # Copy master param data (fp32) to payload of col_attr (fp16)
+        # Offloaded fp32 shards are copied to CUDA asynchronously by the sharded model
+        h2d_params = set(self.model.on_step_end([p for group in self.optim.param_groups for p in group['params']]))
         # TODO() improve efficiency by gathering tensors into a chunk and transfering
         # a chunk.
         for group in self.optim.param_groups:
             for p in group['params']:
+                if p in h2d_params:
+                    p.data = p.col_attr.sharded_data_tensor.payload
+                    continue
                 is_param_sharded = p.col_attr.sharded_data_tensor.is_sharded
                 if not is_param_sharded:
                     # We use ZeRO-2 here
@@ -178,6 +185,7 @@ class ShardedOptimizerV2(ColossalaiOptimizer):
         self.model.backward_by_grad(tensor, grad)
 
     def clip_grad_norm(self, model: nn.Module, max_norm: float):
+        self.model.wait_grad_offload()
         if self.optim_state == OptimState.SCALED:
             self._unscale_grads()
         return super().clip_grad_norm(model, max_norm)
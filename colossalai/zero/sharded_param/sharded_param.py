@@ -5,6 +5,9 @@ from typing import Optional, Tuple
 
 
 class ShardedParamV2(object):
+    # Attributes of every param are read and reset in each iteration,
+    # slots make these accesses cheaper than instance dict lookups
+    __slots__ = ('_sharded_data_tensor', 'fp16_grad', 'fp32_grad', 'offload_grad', 'param', 'bwd_count')
 
     def __init__(self,
                  param: torch.nn.Parameter,
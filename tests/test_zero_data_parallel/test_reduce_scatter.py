@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+from functools import partial
+
+import colossalai
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from colossalai.context.parallel_mode import ParallelMode
+from colossalai.core import global_context as gpc
+from colossalai.testing import rerun_on_exception
+from colossalai.utils import free_port
+from colossalai.zero.sharded_model._utils import nccl_supports_avg
+from colossalai.zero.sharded_model.reduce_scatter import ReduceScatterBucketer
+
+from common import CONFIG
+
+
+def _reduce_scatter(tensors, group, op):
+    outputs = [None] * len(tensors)
+    # 1MB buckets, the largest tensor is reduce-scattered directly and the others are bucketed
+    reducer = ReduceScatterBucketer(bucket_size_mb=1)
+    for i, tensor in enumerate(tensors):
+        reducer.reduce_scatter_async(tensor.clone(), group, callback_fn=partial(outputs.__setitem__, i), op=op)
+    reducer.flush()
+    torch.cuda.synchronize()
+    return [output.clone() for output in outputs]
+
+
+def run_avg_test():
+    group = gpc.get_group(ParallelMode.DATA)
+    if not nccl_supports_avg(group):
+        return
+    world_size = dist.get_world_size(group)
+    torch.manual_seed(dist.get_rank())
+    tensors = [torch.randn(world_size * numel, device=torch.cuda.current_device()) for numel in [3, 517, 2**20]]
+    sum_outputs = _reduce_scatter(tensors, group, dist.ReduceOp.SUM)
+    avg_outputs = _reduce_scatter(tensors, group, dist.ReduceOp.AVG)
+    for sum_output, avg_output in zip(sum_outputs, avg_outputs):
+        # same as the postdivide of ShardedModelV2 after a SUM reduce-scatter
+        assert torch.allclose(sum_output.div_(world_size), avg_output)
+
+
+def run_dist(rank, world_size, port):
+    colossalai.launch(config=CONFIG, rank=rank, world_size=world_size, host='localhost', port=port, backend='nccl')
+    run_avg_test()
+
+
+@pytest.mark.dist
+@pytest.mark.parametrize("world_size", [2])
+@rerun_on_exception(exception_type=mp.ProcessRaisedException, pattern=".*Address already in use.*")
+def test_reduce_scatter_avg(world_size):
+    run_func = partial(run_dist, world_size=world_size, port=free_port())
+    mp.spawn(run_func, nprocs=world_size)
+
+
+if __name__ == '__main__':
+    test_reduce_scatter_avg(world_size=2)
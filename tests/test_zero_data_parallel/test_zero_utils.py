@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import pytest
+import torch
+import torch.distributed as dist
+from colossalai.zero.sharded_model._utils import (cast_float_arguments_to_fp16, chunk_and_pad, nccl_supports_avg,
+                                                  parse_nccl_version)
+
+
+def _check_chunks(tensor, padded, num_chunks):
+    assert padded.dim() == 1 and padded.is_contiguous()
+    assert padded.numel() % num_chunks == 0 and padded.numel() >= tensor.numel()
+    ref_chunks = torch.flatten(tensor).chunk(num_chunks)
+    for i, chunk in enumerate(padded.chunk(num_chunks)):
+        expected = torch.zeros_like(chunk)
+        if i < len(ref_chunks):
+            expected[:ref_chunks[i].numel()] = ref_chunks[i]
+        assert torch.equal(chunk, expected)
+
+
+@pytest.mark.parametrize("shape", [(8,), (7,), (3, 5), (2,), (1,)])
+@pytest.mark.parametrize("num_chunks", [1, 2, 4])
+def test_chunk_and_pad(shape, num_chunks):
+    tensor = torch.randn(shape)
+    padded = chunk_and_pad(tensor, num_chunks)
+    _check_chunks(tensor, padded, num_chunks)
+
+
+@pytest.mark.parametrize("shape", [(7,), (3, 5), (2,)])
+@pytest.mark.parametrize("num_chunks", [2, 4])
+def test_chunk_and_pad_out(shape, num_chunks):
+    tensor = torch.randn(shape)
+    # out is larger than needed and dirty, only the tail of the result should be zeroed
+    out = torch.full((32,), float('nan'))
+    padded = chunk_and_pad(tensor, num_chunks, out=out)
+    assert padded.data_ptr() == out.data_ptr()
+    _check_chunks(tensor, padded, num_chunks)
+    assert torch.isnan(out[padded.numel():]).all()
+
+
+@pytest.mark.parametrize("version,expected", [(2708, (2, 7)), (21003, (2, 10)), (21803, (2, 18)), ((2, 7, 8), (2, 7)),
+                                              ((2, 10, 3), (2, 10))])
+def test_parse_nccl_version(version, expected):
+    assert parse_nccl_version(version) == expected
+
+
+@pytest.mark.skipif(not hasattr(dist.ReduceOp, 'AVG'), reason='ReduceOp.AVG is not available')
+@pytest.mark.parametrize("backend,version,expected", [('nccl', 2708, False), ('nccl', 21003, True),
+                                                      ('nccl', (2, 10, 3), True), ('gloo', (2, 10, 3), False)])
+def test_nccl_supports_avg(monkeypatch, backend, version, expected):
+    monkeypatch.setattr(dist, 'get_backend', lambda group=None: backend)
+    monkeypatch.setattr(torch.cuda.nccl, 'version', lambda: version)
+    assert nccl_supports_avg() == expected
+
+
+def test_cast_float_arguments_to_fp16():
+    x = torch.randn(2, 3)
+    y = torch.randn(4, requires_grad=True)
+    z = torch.randn(3, 2).t()
+    half = torch.randn(2).half()
+    label = torch.arange(4)
+    args = (x, [label, (z, 'tag')], {'y': y})
+    kwargs = {'mask': {'half': half, 'scale': 2.0}, 'z': [z], 'flag': None}
+
+    fp16_args, fp16_kwargs = cast_float_arguments_to_fp16(*args, **kwargs)
+
+    # the structure is rebuilt, and each fp32 tensor is cast in place of the original one
+    assert isinstance(fp16_args, tuple) and len(fp16_args) == 3
+    fp16_x, (fp16_label, (fp16_z, tag)), fp16_y_dict = fp16_args
+    assert tag == 'tag' and fp16_label is label
+    assert fp16_kwargs['mask']['half'] is half and fp16_kwargs['mask']['scale'] == 2.0
+    assert fp16_kwargs['flag'] is None
+    for fp16_tensor, tensor in [(fp16_x, x), (fp16_z, z), (fp16_kwargs['z'][0], z), (fp16_y_dict['y'], y)]:
+        assert fp16_tensor.dtype is torch.float16
+        assert fp16_tensor.shape == tensor.shape
+        assert torch.equal(fp16_tensor, tensor.detach().half())
+
+    # fp32 tensors requiring grad are cast by half(), so that the cast is recorded by autograd
+    fp16_y = fp16_y_dict['y']
+    assert fp16_y.requires_grad and fp16_y.grad_fn is not None
+    fp16_y.float().sum().backward()
+    assert torch.equal(y.grad, torch.ones_like(y))
+    assert not fp16_x.requires_grad
+
+
+if __name__ == '__main__':
+    test_chunk_and_pad((3, 5), 4)
+    test_chunk_and_pad_out((3, 5), 4)
+    test_cast_float_arguments_to_fp16()